@@ -0,0 +1,19 @@
+// Browser-side callbacks for dashboard.py. Dash loads every file in
+// assets/ automatically.
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    graph: {
+        // Append the newest samples held in 'live-store' to the two traces
+        // of the live graph (energy, zone temperature), keeping at most
+        // `max_points` points per trace.
+        extend: function (modified_timestamp, data) {
+            if (!data || !data.x || data.x.length === 0) {
+                return window.dash_clientside.no_update;
+            }
+            return [
+                {x: [data.x, data.x], y: [data.E_KWh_cumulative, data.T_z]},
+                [0, 1],
+                data.max_points
+            ];
+        }
+    }
+});
@@ -0,0 +1,68 @@
+"""
+Ahead-of-time compiles the live simulator's step kernels into a regular
+extension module, hvac_sim/hvac_kernel_aot*.so.
+
+HVACSimulator uses it when present, so a (re)started live service neither
+JIT-compiles the kernel nor loads it from Numba's on-disk cache. Without
+it the simulator falls back to the JIT kernel as before.
+
+Run after installing the requirements, and again whenever the kernel,
+Params or StepCoeffs change:
+
+    python build_kernel.py
+
+The module also exports the Params/StepCoeffs layout it was built for;
+if that no longer matches, the simulator logs a warning and uses the JIT
+kernels until it is rebuilt.
+
+numba.pycc is deprecated (importing it raises a
+NumbaPendingDeprecationWarning) and will be removed from a future Numba
+release; until then this keeps working with the pinned numba version, and
+the JIT fallback covers a Numba without it.
+"""
+import os
+
+from numba import types
+from numba.pycc import CC
+
+from hvac_sim.parameters import ParamsTuple
+from hvac_sim.physics import StepCoeffs
+from hvac_sim.simulator import _KERNEL_LAYOUT, _step_kernel, _step_no_sol_kernel
+
+cc = CC("hvac_kernel_aot")
+cc.output_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "hvac_sim")
+
+f8 = types.float64
+params_t = types.NamedUniTuple(f8, len(ParamsTuple._fields), ParamsTuple)
+coeffs_t = types.NamedUniTuple(f8, len(StepCoeffs._fields), StepCoeffs)
+
+# Same arguments and results as simulator._step_kernel (float64 throughout)
+@cc.export("step_kernel", types.UniTuple(f8, 6)(
+    f8, f8, f8,              # T_z, T_w, CO2_z
+    f8, f8, f8, f8, f8,      # T_out, N_occ, T_set, I_sol, Q_int
+    f8, f8, f8,              # dt_s, e_sum, e_comp
+    params_t, coeffs_t,
+))
+def step_kernel(T_z, T_w, CO2_z, T_out, N_occ, T_set, I_sol, Q_int, dt_s, e_sum, e_comp, p, c):
+    return _step_kernel(T_z, T_w, CO2_z, T_out, N_occ, T_set, I_sol, Q_int, dt_s, e_sum, e_comp, p, c)
+
+# Same as simulator._step_no_sol_kernel: the above without the I_sol argument
+@cc.export("step_kernel_no_sol", types.UniTuple(f8, 6)(
+    f8, f8, f8,              # T_z, T_w, CO2_z
+    f8, f8, f8, f8,          # T_out, N_occ, T_set, Q_int
+    f8, f8, f8,              # dt_s, e_sum, e_comp
+    params_t, coeffs_t,
+))
+def step_kernel_no_sol(T_z, T_w, CO2_z, T_out, N_occ, T_set, Q_int, dt_s, e_sum, e_comp, p, c):
+    return _step_no_sol_kernel(T_z, T_w, CO2_z, T_out, N_occ, T_set, Q_int, dt_s, e_sum, e_comp, p, c)
+
+# Checked by the simulator on import (see simulator._KERNEL_LAYOUT); the
+# value is a compile-time constant of the built module
+@cc.export("kernel_layout", types.int64())
+def kernel_layout():
+    return _KERNEL_LAYOUT
+
+
+if __name__ == "__main__":
+    cc.compile()
+    print(f"Built {cc.name} in {cc.output_dir}")
@@ -1,80 +1,236 @@
 import dash
 from dash import dcc, html
-from dash.dependencies import Input, Output, State
+from dash.dependencies import Input, Output, State, ClientsideFunction
+from dash.exceptions import PreventUpdate
 import plotly.graph_objects as go
-import pandas as pd
 import os
 from dotenv import load_dotenv
 import threading
 import time
-from collections import deque
+import functools
+import logging
+import dataclasses
+from dataclasses import dataclass, field
+import numpy as np
 from num2words import num2words
 import random
 
 # Import our custom modules
 from hvac_sim.parameters import Params
 from hvac_sim.simulator import HVACSimulator
-from mqtt_integration.client import MQTTClient, load_mqtt_config
+from mqtt_integration.client import MQTTClient, get_mqtt_config
 
 # --- 1. INITIAL SETUP AND STATE MANAGEMENT ---
 
+# Log through the handler set up in mqtt_integration.client, instead of
+# print(), which takes the stdout lock on the MQTT thread
+logger = logging.getLogger(__name__)
+
 # Load environment variables from local.env
 load_dotenv("local.env")
 
-# Thread-safe data storage for communication between MQTT thread and Dash app
-data_deque = deque(maxlen=288)  # Store last 24 hours at 5-min intervals
-lock = threading.Lock()
+# MQTT topics, read once here instead of inside the callbacks
+SENSOR_TOPIC = os.getenv("BROKER_TOPIC")
+CONTROL_TOPIC = os.getenv("CONTROL_TOPIC")
+
+@dataclass
+class SampleRing:
+    """
+    Fixed-size history of simulation samples, kept as one preallocated
+    NumPy array per column so that appending never allocates.
+
+    Safe without a lock for one writer (the MQTT thread) and any number of
+    readers (Dash callbacks): the writer fills a slot first and only then
+    bumps `count`, a single int assignment that is atomic under the GIL, so
+    readers never see a sample before it is complete.
+    """
+    size: int = 288  # Store last 24 hours at 5-min intervals
+    count: int = 0   # Total number of samples ever written
+    timestamp: np.ndarray = field(init=False)  # ns since the epoch (UTC), as int64
+    T_z: np.ndarray = field(init=False)
+    CO2_z: np.ndarray = field(init=False)
+    P_e: np.ndarray = field(init=False)
+    E_KWh_cumulative: np.ndarray = field(init=False)
+    N_occ: np.ndarray = field(init=False)
+    T_set: np.ndarray = field(init=False)
+
+    def __post_init__(self):
+        self.timestamp = np.empty(self.size, dtype=np.int64)
+        self.T_z = np.empty(self.size)
+        self.CO2_z = np.empty(self.size)
+        self.P_e = np.empty(self.size)
+        self.E_KWh_cumulative = np.empty(self.size)
+        self.N_occ = np.empty(self.size, dtype=np.int64)
+        self.T_set = np.empty(self.size)
+
+    def append(self, timestamp, T_z, CO2_z, P_e, E_KWh_cumulative, N_occ, T_set):
+        """
+        Write one sample into the next slot, overwriting the oldest one when full.
+        Only ever called from the single producer thread.
+        """
+        i = self.count % self.size
+        self.timestamp[i] = timestamp
+        self.T_z[i] = T_z
+        self.CO2_z[i] = CO2_z
+        self.P_e[i] = P_e
+        self.E_KWh_cumulative[i] = E_KWh_cumulative
+        self.N_occ[i] = N_occ
+        self.T_set[i] = T_set
+        # Publish the sample to readers only once every column is written
+        self.count = self.count + 1
+
+    def read(self, names, start=0):
+        """
+        Copy out the given columns for samples `start` up to now, oldest first.
+        Returns (count, {name: array}) where `count` is how many samples had
+        been written when the read began. Samples the writer overwrote (or
+        may be overwriting) while we copied are dropped from the front.
+        """
+        end = self.count
+        start = max(start, end - self.size)
+        idx = np.arange(start, end) % self.size
+        cols = {name: getattr(self, name)[idx] for name in names}
+
+        # The slot for sample `self.count` may be mid-write, hence the +1
+        stale = self.count + 1 - self.size - start
+        if stale > 0:
+            cols = {name: col[stale:] for name, col in cols.items()}
+        return end, cols
+
+    def latest(self, names):
+        """Return {name: value} for the most recent sample."""
+        i = (self.count - 1) % self.size
+        return {name: getattr(self, name)[i] for name in names}
+
+
+# Lock-free storage for communication between MQTT thread and Dash app
+samples = SampleRing()
 
 # Global variable for the MQTT client so we can use it in callbacks
 mqtt_client = None
 
+# The last full figure sent to a browser, as (sample count, plain figure dict).
+# Page reloads and extra browsers that open while no new data has arrived
+# reuse it instead of building and validating a new Figure.
+last_figure = (None, None)
+
+# Layout for three axes (energy, temp, people), built and validated once and
+# shared by every figure instead of being rebuilt on each redraw
+BASE_LAYOUT = go.Layout(
+    title='Live Simulation Data',
+    xaxis_title='Time',
+    yaxis=dict(title='Cumulative Energy (kWh)', color='orange'),
+    yaxis2=dict(title='Zone Temperature (°C)', color='royalblue', overlaying='y', side='right'),
+    yaxis3=dict(
+        title='People Present', color='green',
+        anchor="free", overlaying="y", side="left", position=0.05
+    ),
+    legend=dict(x=0, y=1.1, orientation='h'),
+    margin=dict(l=60, r=60, t=60, b=60)
+)
+
+# Shown until the first sensor message arrives
+EMPTY_FIGURE = go.Figure(layout=go.Layout(title="Waiting for sensor data...")).to_plotly_json()
+
 # --- 2. HVAC SIMULATOR AND MQTT LOGIC ---
 
-def on_sensor_data_received(msg_dict):
-    """Callback triggered by MQTT client on new message."""
+def spread_timestamps(prev_ns, arrival_ns, n):
+    """
+    Timestamps for the `n` samples of one message that arrived at
+    `arrival_ns`: a message carries several readings taken since the
+    previous one, so they are spread evenly over (prev_ns, arrival_ns],
+    the last one at the arrival time. Without an earlier timestamp (the
+    very first message) they all get the arrival time.
+    """
+    if prev_ns is None or prev_ns >= arrival_ns or n == 1:
+        return [arrival_ns] * n
+    step = (arrival_ns - prev_ns) / n
+    return [arrival_ns - int(step * (n - 1 - j)) for j in range(n)]
+
+def on_sensor_batch_received(messages):
+    """
+    Callback triggered by the batched MQTT subscription with every message
+    that arrived since the last flush, as (arrival_ns, message) pairs. All
+    their samples go through the simulator in one vectorized call, one
+    input column per signal.
+    """
+    batch, timestamps = [], []
+    prev_ns = int(samples.latest(["timestamp"])["timestamp"]) if samples.count else None
+    for arrival_ns, msg_dict in messages:
+        msg_samples = msg_dict.get("batch", (msg_dict,))
+        batch.extend(msg_samples)
+        timestamps.extend(spread_timestamps(prev_ns, arrival_ns, len(msg_samples)))
+        prev_ns = arrival_ns
+    if not batch:
+        return
+
+    n = len(batch)
+    try:
+        T_out = np.fromiter((sample["T_out"] for sample in batch), float, n)
+        N_occ = np.fromiter((sample["N_occ"] for sample in batch), np.int64, n)
+        T_set = np.fromiter((sample["T_set"] for sample in batch), float, n)
+        I_sol = np.fromiter((sample.get("I_sol", 0.0) for sample in batch), float, n)
+    except (KeyError, ValueError, TypeError):
+        # Some sample is malformed: step them one by one so that only the
+        # bad ones get dropped (and logged)
+        for sample, timestamp in zip(batch, timestamps):
+            process_sample(sample, timestamp)
+        return
+
+    results = hvac_sim.step_many(T_out, N_occ, T_set, I_sol)
+
+    T_z, CO2_z = results['T_z'], results['CO2_z']
+    P_e, energy = results['P_e'], results['E_KWh_cumulative']
+    for i in range(n):
+        samples.append(timestamps[i], T_z[i], CO2_z[i], P_e[i], energy[i], N_occ[i], T_set[i])
+
+def process_sample(msg_dict, timestamp):
+    """
+    Run one simulation step for a single sensor sample and store the
+    result under `timestamp` (ns since the epoch).
+    """
     global hvac_sim
     try:
         n_occ = int(msg_dict["N_occ"])
-        inputs = {
-            "T_out": float(msg_dict["T_out"]),
-            "N_occ": n_occ,
-            "T_set": float(msg_dict["T_set"]),
-            "I_sol": float(msg_dict.get("I_sol", 0.0))
-        }
-        
-        # Run one simulation step
-        results = hvac_sim.step(inputs)
-        
-        # Add a timestamp and store the new data point
-        results['timestamp'] = pd.to_datetime('now')
-        results['N_occ'] = n_occ  # Add number of people
-        results['T_set'] = float(msg_dict["T_set"])  # Store setpoint with results!
-        with lock:
-            data_deque.append(results)
-            
-    except (KeyError, ValueError) as e:
-        print(f"Error processing message: {e}.")
+        T_set = msg_dict["T_set"]
+
+        # Run one simulation step; the results land in the simulator's
+        # reused output buffer, in OUT_FIELDS order. step_into converts
+        # the (decoded JSON) values to float itself, where they aren't yet.
+        T_z, _, CO2_z, P_e, energy = hvac_sim.step_into(
+            msg_dict["T_out"], n_occ, T_set, msg_dict.get("I_sol", 0.0)
+        )
+
+        # Store the new data point, together with the number of people
+        # and the setpoint used for this step
+        samples.append(timestamp, T_z, CO2_z, P_e, energy, n_occ, T_set)
+
+    except (KeyError, ValueError, TypeError) as e:
+        logger.exception("Error processing message: %s.", e)
 
 def mqtt_service_thread():
     """Main function for the MQTT background thread."""
     global mqtt_client
     
-    mqtt_config = load_mqtt_config()
-    mqtt_config.client_id = f'{mqtt_config.client_id}-{random.randint(0, 1000)}'
+    mqtt_config = get_mqtt_config()
+    mqtt_config = dataclasses.replace(mqtt_config, client_id=f'{mqtt_config.client_id}-{random.randint(0, 1000)}')
     
-    sensor_topic = os.getenv("BROKER_TOPIC")
-    print("BROKER_TOPIC (env):", os.getenv("BROKER_TOPIC"))
-    print("CONTROL_TOPIC (env):", os.getenv("CONTROL_TOPIC"))
+    logger.info("BROKER_TOPIC (env): %s", SENSOR_TOPIC)
+    logger.info("CONTROL_TOPIC (env): %s", CONTROL_TOPIC)
     
-    mqtt_client = MQTTClient(config=mqtt_config, topic=sensor_topic)
-    mqtt_client.connect_mqtt()
-    mqtt_client.subscribe(callback=on_sensor_data_received)
+    mqtt_client = MQTTClient(config=mqtt_config, topic=SENSOR_TOPIC)
+    mqtt_client.connect_mqtt(background=False)
+    mqtt_client.subscribe_batched(batch_callback=on_sensor_batch_received)
     
-    # The Paho-MQTT loop_start() runs in a background thread itself,
-    # but we'll keep this parent thread alive to be explicit.
-    print(f"MQTT service running in background, subscribed to {sensor_topic}.")
-    while True:
-        time.sleep(1)
+    # This thread runs the Paho-MQTT network loop itself, rather than
+    # starting another loop thread with loop_start() and idling here.
+    logger.info("MQTT service running in background, subscribed to %s.", SENSOR_TOPIC)
+    mqtt_client.run_forever()
+
+def to_local_datetime(timestamps_ns):
+    """Convert int64 ns-since-epoch timestamps into local wall-clock datetime64 values for plotting."""
+    utc_offset_ns = time.localtime().tm_gmtoff * 1_000_000_000
+    return (timestamps_ns + utc_offset_ns).astype("datetime64[ns]")
 
 # --- 3. DASH APPLICATION LAYOUT ---
 
@@ -102,59 +258,103 @@ app.layout = html.Div(style={'backgroundColor': '#F0F0F0', 'padding': '20px'}, c
         ),
         html.Button('Update Setpoint', id='update-setpoint-button', n_clicks=0, style={'marginTop': '15px'})
     ]),
-    dcc.Interval(id='interval-component', interval=2*1000, n_intervals=0) # Update every 2 seconds
+    dcc.Interval(id='interval-component', interval=2*1000, n_intervals=0), # Update every 2 seconds
+    dcc.Store(id='rendered-count', data=None),  # How many samples this browser has already drawn
+    dcc.Store(id='live-store', data=[])         # Newest samples, picked up by the browser-side graph update
 ])
 
 # --- 4. DASH CALLBACKS FOR INTERACTIVITY ---
 
 @app.callback(
-    [Output('live-graph', 'figure'), Output('live-kpi-text', 'children')],
-    [Input('interval-component', 'n_intervals')]
+    [Output('live-graph', 'figure'), Output('live-store', 'data'), Output('rendered-count', 'data')],
+    [Input('interval-component', 'n_intervals')],
+    [State('rendered-count', 'data')]
+)
+def update_graph_live(n, rendered):
+    global last_figure
+    # Lock-free: read the sample count once and work from that snapshot
+    count = samples.count
+    if count == rendered:
+        # Nothing new since the last tick (most ticks, as the publisher only
+        # sends every 10 s): skip the whole response, and with it the KPI
+        # callback that listens to 'rendered-count'
+        raise PreventUpdate
+    if count == 0:
+        # Return empty state if no data yet
+        return EMPTY_FIGURE, dash.no_update, 0
+
+    # Only the samples this browser hasn't drawn yet. If it has never
+    # drawn anything (or fell further behind than the history we keep),
+    # send the whole history and redraw the figure from scratch.
+    redraw = not rendered or count - rendered >= samples.size
+    if redraw and last_figure[0] == count:
+        return last_figure[1], dash.no_update, count
+    start = 0 if redraw else rendered
+    count, cols = samples.read(('timestamp', 'E_KWh_cumulative', 'T_z'), start)
+    timestamps = to_local_datetime(cols['timestamp'])
+    energy = cols['E_KWh_cumulative']
+    zone_temp = cols['T_z']
+
+    if redraw:
+        # Plain dict rather than a go.Figure, so the cached copy skips
+        # Plotly's validation and goes straight to JSON encoding
+        last_figure = (count, build_figure(timestamps, energy, zone_temp).to_plotly_json())
+        return last_figure[1], dash.no_update, count
+
+    # The browser appends these to the existing traces (see assets/graph.js)
+    new_points = dict(x=timestamps, E_KWh_cumulative=energy, T_z=zone_temp, max_points=samples.size)
+    return dash.no_update, new_points, count
+
+# Runs in the browser: turns the newest samples in 'live-store' into a
+# Plotly.extendTraces call on the graph, without a round trip to the server.
+app.clientside_callback(
+    ClientsideFunction(namespace='graph', function_name='extend'),
+    Output('live-graph', 'extendData'),
+    [Input('live-store', 'modified_timestamp')],
+    [State('live-store', 'data')]
+)
+
+@app.callback(
+    Output('live-kpi-text', 'children'),
+    [Input('rendered-count', 'data')]
 )
-def update_graph_live(n):
-    with lock:
-        if not data_deque:
-            # Return empty state if no data yet
-            empty_fig = go.Figure().update_layout(title="Waiting for sensor data...")
-            return empty_fig, "No data yet."
-        df = pd.DataFrame(list(data_deque))
-
-    # Create the figure
-    fig = go.Figure()
-    # Add cumulative energy trace
-    fig.add_trace(go.Scatter(
-        x=df['timestamp'], y=df['E_KWh_cumulative'], name='Cumulative Energy (kWh)',
-        mode='lines', line=dict(color='orange')
-    ))
-    # Add zone temperature trace
-    fig.add_trace(go.Scatter(
-        x=df['timestamp'], y=df['T_z'], name='Zone Temperature (°C)',
-        mode='lines', line=dict(color='royalblue'), yaxis='y2'
-    ))
-
-    # Update layout for three axes (energy, temp, people)
-    fig.update_layout(
-        title='Live Simulation Data',
-        xaxis_title='Time',
-        yaxis=dict(title='Cumulative Energy (kWh)', color='orange'),
-        yaxis2=dict(title='Zone Temperature (°C)', color='royalblue', overlaying='y', side='right'),
-        yaxis3=dict(
-            title='People Present', color='green',
-            anchor="free", overlaying="y", side="left", position=0.05
+def update_kpi_live(count):
+    # Only runs when update_graph_live has drawn new samples
+    if not count:
+        return "No data yet."
+    latest_data = samples.latest(('T_z', 'CO2_z', 'P_e', 'E_KWh_cumulative', 'N_occ', 'T_set'))
+
+    return build_kpi_text(latest_data)
+
+def build_figure(timestamps, energy, zone_temp):
+    """Build the full live figure on top of the shared BASE_LAYOUT."""
+    return go.Figure(data=[
+        # Cumulative energy trace
+        go.Scatter(
+            x=timestamps, y=energy, name='Cumulative Energy (kWh)',
+            mode='lines', line=dict(color='orange')
         ),
-        legend=dict(x=0, y=1.1, orientation='h'),
-        margin=dict(l=60, r=60, t=60, b=60)
-    )
+        # Zone temperature trace
+        go.Scatter(
+            x=timestamps, y=zone_temp, name='Zone Temperature (°C)',
+            mode='lines', line=dict(color='royalblue'), yaxis='y2'
+        ),
+    ], layout=BASE_LAYOUT)
+
+@functools.lru_cache(maxsize=128)
+def energy_in_words(kwh):
+    """Spell out an (already rounded) energy value; memoized, as it rarely changes between ticks."""
+    return num2words(kwh)
 
-    # Get latest data for KPIs
-    latest_data = df.iloc[-1]
+def build_kpi_text(latest_data):
+    """Build the KPI block from the latest sample."""
     total_energy_kwh = latest_data['E_KWh_cumulative']
-    total_energy_words = num2words(round(total_energy_kwh, 1))
-    n_people = latest_data.get('N_occ', 'N/A')
-    current_setpoint = latest_data.get('T_set', 'N/A')
+    total_energy_words = energy_in_words(round(float(total_energy_kwh), 1))
+    n_people = latest_data['N_occ']
+    current_setpoint = latest_data['T_set']
 
     # KPI text block with Setpoint line
-    kpi_text = html.Div([
+    return html.Div([
         html.H4("Current State"),
         html.P(f"Zone Temp: {latest_data['T_z']:.1f} °C"),
         html.P(f"Setpoint: {current_setpoint:.1f} °C"),   # <-- Current setpoint!
@@ -178,7 +378,10 @@ def update_graph_live(n):
         html.P(f"({total_energy_words} kilowatt-hours)")
     ])
 
-    return fig, kpi_text
+@functools.lru_cache(maxsize=32)
+def setpoint_payload(temp_setpoint):
+    """Encoded MQTT payload for a setpoint; the slider only has 21 values (18–28 °C in 0.5 steps)."""
+    return str(temp_setpoint).encode()
 
 @app.callback(
     Output('update-setpoint-button', 'style'), # Just to provide a dummy output
@@ -187,10 +390,8 @@ def update_graph_live(n):
 )
 def update_setpoint(n_clicks, temp_setpoint):
     if n_clicks > 0 and mqtt_client is not None:
-        control_topic = os.getenv("CONTROL_TOPIC")
-        payload = {'T_set': temp_setpoint}
-        mqtt_client.mqtt_client.publish(control_topic, str(temp_setpoint))
-        print(f"UI published new setpoint '{temp_setpoint}°C' to topic '{control_topic}'")
+        mqtt_client.mqtt_client.publish(CONTROL_TOPIC, setpoint_payload(temp_setpoint))
+        logger.info("UI published new setpoint '%s°C' to topic '%s'", temp_setpoint, CONTROL_TOPIC)
     
     # Return a default style, as a callback needs an output
     return {'marginTop': '15px'}
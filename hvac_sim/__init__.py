@@ -1,5 +1,5 @@
 # This makes the main functions and classes available
 # directly when you import the package.
-from .parameters import Params
+from .parameters import Params, ParamsTuple
 from .simulate import run_simulation
 
@@ -1,6 +1,7 @@
-from dataclasses import dataclass
+from collections import namedtuple
+from dataclasses import dataclass, field, fields
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class Params:
     """
     Tool-Box to hold all our model's physical parameters.
@@ -27,6 +28,37 @@ class Params:
     COP_cool: float = 3.5  # Cooling efficiency
     COP_heat: float = 3.0  # Heating efficiency
 
+    # Derived coefficients, filled in by __post_init__ (not constructor
+    # arguments). The physics kernels multiply by these instead of
+    # re-dividing by the raw parameters on every step.
+    inv_R_oa: float = field(init=False, repr=False, compare=False)  # kW per K
+    inv_R_wz: float = field(init=False, repr=False, compare=False)  # kW per K
+    inv_R_ow: float = field(init=False, repr=False, compare=False)  # kW per K
+    inv_C_z: float = field(init=False, repr=False, compare=False)   # K per kJ
+    inv_C_w: float = field(init=False, repr=False, compare=False)   # K per kJ
+    inv_COP: float = field(init=False, repr=False, compare=False)   # –
+    k_hvac: float = field(init=False, repr=False, compare=False)    # kW per K   (HVAC load per kelvin off the set-point)
+    k_inf: float = field(init=False, repr=False, compare=False)     # s⁻¹       (Fraction of zone air replaced by infiltration per second)
+    occ_coeff: float = field(init=False, repr=False, compare=False) # ppm·s⁻¹·person⁻¹ (CO₂ rise rate per occupant)
+
+    def __post_init__(self):
+        # Frozen dataclass, so the derived fields are set through object.__setattr__
+        def derive(name, value):
+            object.__setattr__(self, name, value)
+
+        derive("inv_R_oa", 1.0 / self.R_oa)
+        derive("inv_R_wz", 1.0 / self.R_wz)
+        derive("inv_R_ow", 1.0 / self.R_ow)
+        derive("inv_C_z", 1.0 / self.C_z)
+        derive("inv_C_w", 1.0 / self.C_w)
+        derive("inv_COP", 1.0 / self.COP)
+        derive("k_hvac", self.m_air_des * self.c_p)
+        # ACH × V (m³/h) / 3600 is the infiltration flow in m³/s; divided by V
+        # again that is the share of the zone air replaced per second
+        derive("k_inf", self.ACH / 3600.0)
+        # per-person (L/s) / 1000 → m³/s, × 1e6 → ppm·m³/s, / V → ppm/s
+        derive("occ_coeff", self.E_occ / 1000.0 * 1e6 / self.V)
+
     @property
     def C_z_kW(self):
         """Converts the zone capacitance from kilojoules (kJ) to kilowatt-seconds (kW·s)."""
@@ -37,3 +69,12 @@ class Params:
         """Converts the wall capacitance from kilojoules (kJ) to kilowatt-seconds (kW·s)."""
         return self.C_w
 
+    def as_tuple(self) -> "ParamsTuple":
+        """Packs the parameters into a ParamsTuple for the compiled (Numba) kernels."""
+        return ParamsTuple(*(getattr(self, f.name) for f in fields(self)))
+
+
+# Same fields as Params (derived ones included), in the same order, as a plain named tuple. Numba
+# compiles attribute access on it into simple register loads, so this is
+# what gets passed into the jitted physics kernels.
+ParamsTuple = namedtuple("ParamsTuple", [f.name for f in fields(Params)])
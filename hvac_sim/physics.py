@@ -1,70 +1,179 @@
 import numpy as np
+from collections import namedtuple
+from numba import njit
 from typing import Sequence, Dict, Tuple
 from .parameters import Params 
 
-def hvac_power(T_z: float, T_set: float, p: Params) -> Tuple[float, float]:
-    m_air = p.m_air_des
+C_OUT = 400.0   # baseline outdoor CO₂ concentration in ppm (≈ current global average)
+
+@njit(cache=True, fastmath=True)
+def _hvac_power_core(T_z, T_set, p):
+    # Compiled body of `hvac_power`; `p` is a ParamsTuple.
+    # Written without if/else: near the set-point `delta` keeps flipping
+    # sign, which a branch predictor can't guess, so both cases share one
+    # straight-line formula instead.
     delta = T_z - T_set
 
-    if delta > 0:
-        # Cooling needed
-        Q = m_air * p.c_p * delta  # positive, cooling load
-        P = Q / p.COP + p.P_fan_des
-    elif delta < 0:
-        # Heating needed
-        Q = m_air * p.c_p * delta  # negative, heating load
-        P = abs(Q) / p.COP + p.P_fan_des  # COP for heating, or you can set a different COP
-    else:
-        Q = 0.0
-        P = 0.0
+    # positive for a cooling load, negative for a heating load
+    Q = p.k_hvac * delta
+    abs_Q = abs(Q)
+
+    # HVAC (and its fan) is off only when sitting exactly on the set-point.
+    # The same COP is used for heating and cooling.
+    on = abs_Q > 0.0
+    P = on * (abs_Q * p.inv_COP + p.P_fan_des)
 
     return Q, P
 
 
+def hvac_power(T_z: float, T_set: float, p: Params) -> Tuple[float, float]:
+    return _hvac_power_core(float(T_z), float(T_set), p.as_tuple())
 
 
-def rhs(state: Sequence[float], inp: Dict[str, float], p: Params) -> np.ndarray:
+@njit(cache=True, fastmath=True)
+def _rhs_core(T_z, T_w, CO2_z, T_out, N_occ, T_set, I_sol, Q_int, p):
     """
-    Calculates the rate of change for each state variable.
-    'state' is a list or array: [Zone Temperature, Wall Temperature, Zone CO₂]
-    'inp' is a dictionary of external inputs: {'Outside Temp', 'Num Occupants', ...}
-    It returns these rates of change, plus the current electric power use.
+    Compiled body of `rhs`. Works on plain floats and a ParamsTuple `p` only,
+    so Numba can turn it into straight machine code.
+    Returns (dTz, dTw, dCO2, P_e).
     """
-    T_z, T_w, CO2_z = state
-
-    # Unpack external inputs
-    T_out = inp["T_out"]
-    N_occ = inp["N_occ"]
-    T_set = inp["T_set"]
-    I_sol = inp.get("I_sol", 0.0)
-    Q_int = inp.get("Q_int", 100.0 * N_occ)
-
     # Calculate HVAC cooling and power
-    Q_HVAC, P_e = hvac_power(T_z, T_set, p)
+    Q_HVAC, P_e = _hvac_power_core(T_z, T_set, p)
 
     # Calculate temperature derivatives (rates of change)
-    dTz = ((T_out - T_z) / p.R_oa +
-           (T_w - T_z) / p.R_wz +
-           Q_int / 1000.0 -  # convert internal gains from **W** to **kW**
-           Q_HVAC) / p.C_z_kW
+    dTz = ((T_out - T_z) * p.inv_R_oa +
+           (T_w - T_z) * p.inv_R_wz +
+           Q_int * 0.001 -  # convert internal gains from **W** to **kW**
+           Q_HVAC) * p.inv_C_z
+
+    dTw = ((T_z - T_w) * p.inv_R_wz +
+           (T_out - T_w) * p.inv_R_ow +
+           I_sol * 0.001) * p.inv_C_w  # solar gains: W ➜ kW
 
-    dTw = ((T_z - T_w) / p.R_wz +
-           (T_out - T_w) / p.R_ow +
-           I_sol / 1000.0) / p.C_w_kW  # solar gains: W ➜ kW
+    # Calculate CO₂ derivative: infiltration pulls the zone towards the
+    # outdoor level, occupants add to it (see Params.k_inf / occ_coeff)
+    dCO2 = p.k_inf * (C_OUT - CO2_z) + N_occ * p.occ_coeff
 
-    # Calculate CO₂ derivative
-    Vdot_inf = p.ACH * p.V / 3600.0
-    # ACH (air-changes-per-hour) × volume (m³) gives m³ / h
-    # divide by 3600 to express that infiltration flow in m³ / s
+    return dTz, dTw, dCO2, P_e
 
-    C_out = 400.0   # baseline outdoor CO₂ concentration in ppm (≈ current global average)
 
-    E_m3s = p.E_occ * N_occ / 1000.0
-    # occupant CO₂ generation rate:
-    # per-person (L/s) × number of people, then /1000 to convert L → m³
+def read_inputs(inp: Dict[str, float]) -> Tuple[float, float, float, float, float]:
+    """
+    Unpacks the external inputs into (T_out, N_occ, T_set, I_sol, Q_int),
+    all as floats so the compiled kernel only ever sees one type signature.
+    """
+    N_occ = float(inp["N_occ"])
+    return (
+        float(inp["T_out"]),
+        N_occ,
+        float(inp["T_set"]),
+        float(inp.get("I_sol", 0.0)),
+        float(inp.get("Q_int", 100.0 * N_occ)),
+    )
+
 
-    dCO2 = (Vdot_inf * (C_out - CO2_z) + E_m3s * 1e6) / p.V
+def rhs(state: Sequence[float], inp: Dict[str, float], p: Params) -> Tuple[float, float, float, float]:
+    """
+    Calculates the rate of change for each state variable.
+    'state' is a list or array: [Zone Temperature, Wall Temperature, Zone CO₂]
+    'inp' is a dictionary of external inputs: {'Outside Temp', 'Num Occupants', ...}
+    It returns these rates of change, plus the current electric power use,
+    as a plain tuple (dTz, dTw, dCO2, P_e).
+    """
+    T_z, T_w, CO2_z = state
 
     # Return all the calculated rates of change, plus the power usage.
-    return np.array([dTz, dTw, dCO2, P_e])
+    return _rhs_core(
+        float(T_z), float(T_w), float(CO2_z), *read_inputs(inp), p.as_tuple()
+    )
+
+
+# --- Exact (analytic) time step ---
+#
+# With the inputs held constant over a step, the model is linear:
+#   d[T_z, T_w]/dt = A @ [T_z, T_w] + f        dCO2/dt = -k * CO2 + s
+# (the HVAC load m_air·c_p·(T_z − T_set) is linear in T_z too, so it goes
+# into A). Its exact solution over one step of dt seconds is
+#   [T_z, T_w] ← expm(A·dt) @ [T_z, T_w] + A⁻¹(expm(A·dt) − I) @ f
+#   CO2        ← exp(−k·dt) · CO2 + (1 − exp(−k·dt)) / k · s
+# Those matrices only depend on Params and dt, so they are computed once.
+# Unlike forward Euler this stays accurate for long steps (dt_s = 900 or 1800).
+
+# Per-(Params, dt) coefficients of the exact step, consumed by `_step_core`.
+# Ad_* = expm(A·dt)  (z = zone, w = wall). The forcing f is itself a fixed
+# linear map of the step's inputs, so A⁻¹(expm(A·dt) − I) and that map are
+# folded into one input matrix B_* over (T_out, Q_int, T_set, I_sol). The
+# CO₂ update likewise reduces to a decay, a per-occupant gain and a constant.
+StepCoeffs = namedtuple("StepCoeffs", [
+    "Ad_zz", "Ad_zw", "Ad_wz", "Ad_ww",
+    "B_z_out", "B_z_int", "B_z_set", "B_z_sol",
+    "B_w_out", "B_w_int", "B_w_set", "B_w_sol",
+    "co2_decay", "co2_occ", "co2_const",
+])
+
+
+def _expm2(M: np.ndarray) -> np.ndarray:
+    """Closed-form matrix exponential of a 2×2 matrix with real eigenvalues."""
+    s = np.trace(M) / 2.0
+    q = np.sqrt(max(s * s - np.linalg.det(M), 0.0))
+    # sinh(q)/q → 1 as q → 0 (repeated eigenvalue)
+    sinhc = np.sinh(q) / q if q > 1e-12 else 1.0
+    return np.exp(s) * ((np.cosh(q) - s * sinhc) * np.eye(2) + sinhc * M)
+
+
+def step_coeffs(p: Params, dt_s: float) -> StepCoeffs:
+    """
+    Precomputes the exact-step coefficients for parameters `p` and a time
+    step of `dt_s` seconds.
+    """
+    A = np.array([
+        [-(p.inv_R_oa + p.inv_R_wz + p.k_hvac) * p.inv_C_z, p.inv_R_wz * p.inv_C_z],
+        [p.inv_R_wz * p.inv_C_w, -(p.inv_R_wz + p.inv_R_ow) * p.inv_C_w],
+    ])
+    Ad = _expm2(A * dt_s)
+    M = np.linalg.solve(A, Ad - np.eye(2))
+
+    # Forcing f (K/s) per unit of each input: T_out (K), Q_int (W),
+    # T_set (K), I_sol (W)
+    F = np.array([
+        [p.inv_R_oa * p.inv_C_z, 0.001 * p.inv_C_z, p.k_hvac * p.inv_C_z, 0.0],
+        [p.inv_R_ow * p.inv_C_w, 0.0, 0.0, 0.001 * p.inv_C_w],
+    ])
+    B = M @ F
+
+    # CO₂: infiltration replaces the zone air at ACH per hour
+    k_co2 = p.k_inf
+    co2_decay = np.exp(-k_co2 * dt_s)
+    co2_gain = -np.expm1(-k_co2 * dt_s) / k_co2 if k_co2 > 0.0 else float(dt_s)
+
+    return StepCoeffs(Ad[0, 0], Ad[0, 1], Ad[1, 0], Ad[1, 1],
+                      *B[0], *B[1],
+                      co2_decay, co2_gain * p.occ_coeff, co2_gain * p.k_inf * C_OUT)
+
+
+@njit(cache=True, fastmath=True)
+def _step_core(T_z, T_w, CO2_z, T_out, N_occ, T_set, I_sol, Q_int, p, c):
+    """
+    Advances the state by one exact time step. `p` is a ParamsTuple and `c`
+    the matching StepCoeffs. Returns the new (T_z, T_w, CO2_z) and the
+    electric power P_e drawn at the start of the step.
+    """
+    # Power is taken at the start of the step, as the Euler scheme did
+    Q_HVAC, P_e = _hvac_power_core(T_z, T_set, p)
+
+    # Only multiply-adds with the precomputed coefficients are left
+    T_z_new = (c.Ad_zz * T_z + c.Ad_zw * T_w + c.B_z_out * T_out +
+               c.B_z_int * Q_int + c.B_z_set * T_set + c.B_z_sol * I_sol)
+    T_w_new = (c.Ad_wz * T_z + c.Ad_ww * T_w + c.B_w_out * T_out +
+               c.B_w_int * Q_int + c.B_w_set * T_set + c.B_w_sol * I_sol)
+
+    # CO₂: decay towards outdoor air plus occupants' contribution
+    CO2_new = c.co2_decay * CO2_z + c.co2_occ * N_occ + c.co2_const
+
+    return T_z_new, T_w_new, CO2_new, P_e
+
 
+# Compile (or load from the on-disk cache) right away, so the first real
+# simulation step or MQTT message doesn't pay the JIT start-up cost.
+_rhs_core(24.0, 24.0, 600.0, 25.0, 0.0, 24.0, 0.0, 0.0, Params().as_tuple())
+_step_core(24.0, 24.0, 600.0, 25.0, 0.0, 24.0, 0.0, 0.0, Params().as_tuple(), step_coeffs(Params(), 300.0))
@@ -1,7 +1,43 @@
 import pandas as pd
 import numpy as np
+from numba import njit
 from .parameters import Params
-from .physics import rhs # Import the physics equations from our package
+from .physics import _step_core, step_coeffs # Import the physics equations from our package
+
+@njit(cache=True)
+def _simulate_core(T_out, N_occ, T_set, I_sol, Q_int, state0, params, coeffs):
+    """
+    Compiled time-march loop. Takes one NumPy column per input plus a
+    ParamsTuple and the matching StepCoeffs, and returns one preallocated
+    column each for T_z, T_w, CO2_z and P_e over every time step.
+    """
+    n = T_out.shape[0]
+    T_z_col = np.empty(n)
+    T_w_col = np.empty(n)
+    CO2_col = np.empty(n)
+    P_col = np.empty(n)
+    T_z, T_w, CO2_z = state0[0], state0[1], state0[2]
+
+    for i in range(n):
+        # 1. Advance the state variables (T_z, T_w, CO₂) by one exact step,
+        #    getting the electric power drawn during it.
+        T_z, T_w, CO2_z, P_e = _step_core(
+            T_z, T_w, CO2_z, T_out[i], N_occ[i], T_set[i], I_sol[i], Q_int[i], params, coeffs
+        )
+
+        # 2. Record the results for this time step.
+        T_z_col[i] = T_z
+        T_w_col[i] = T_w
+        CO2_col[i] = CO2_z
+        P_col[i] = P_e
+
+    return T_z_col, T_w_col, CO2_col, P_col
+
+def _shift_ahead(col: np.ndarray, hor: int) -> np.ndarray:
+    """Returns `col` moved up by `hor` rows, padding the tail with NaN."""
+    shifted = np.full(len(col), np.nan)
+    shifted[:max(len(col) - hor, 0)] = col[hor:]
+    return shifted
 
 def run_simulation(df_in: pd.DataFrame, p: Params, dt_s: int = 300) -> pd.DataFrame:
     """
@@ -12,33 +48,37 @@ def run_simulation(df_in: pd.DataFrame, p: Params, dt_s: int = 300) -> pd.DataFr
     dt_s: The time step in seconds (e.g., 300 seconds = 5 minutes).
     returns: A DataFrame with the simulation results (T_z, CO2_z, Power, Energy).
     """
+    # Pull every input out of the DataFrame once, as plain float arrays.
+    T_out = df_in["T_out"].to_numpy(dtype=float)
+    N_occ = df_in["N_occ"].to_numpy(dtype=float)
+    T_set = df_in["T_set"].to_numpy(dtype=float)
+    I_sol = df_in["I_sol"].to_numpy(dtype=float) if "I_sol" in df_in else np.zeros(len(df_in))
+    Q_int = df_in["Q_int"].to_numpy(dtype=float) if "Q_int" in df_in else 100.0 * N_occ
+
     # Set the initial state of the system.
-    T0 = df_in["T_set"].iloc[0]
+    T0 = T_set[0]
     state = np.array([T0, T0, 600.0])    # Initial [T_z, T_w, CO₂_z]
 
-    # Initialize variables to store results
-    energy = 0.0
-    rec = []
-
     # The main simulation loop
-    for t, row in df_in.iterrows():
-        # 1. Calculate the current rates of change using our ODE function.
-        deriv = rhs(state, row, p)
+    T_z_col, T_w_col, CO2_col, P_col = _simulate_core(
+        T_out, N_occ, T_set, I_sol, Q_int, state, p.as_tuple(), step_coeffs(p, dt_s)
+    )
 
-        # 2. Apply the Euler method to update the state variables (T_z, T_w, CO₂).
-        state[:3] += deriv[:3] * dt_s
+    # Accumulate energy for all time steps in one go.
+    E_col = np.cumsum(P_col) * dt_s / 3600.0
 
-        # 3. Get the electric power for this time step and accumulate energy.
-        P_e = deriv[3]
-        energy += P_e * dt_s / 3600.0
-
-        # 4. Record the results for this time step.
-        rec.append((t, state[0], state[1], state[2], P_e, energy))
-
-    # After the loop, convert the list of results into a pandas DataFrame.
+    # Convert the result columns into a pandas DataFrame.
     out = pd.DataFrame(
-        rec, columns=["time", "T_z", "T_w", "CO2_z", "P_e", "E_KWh"]
-    ).set_index("time")
+        {
+            "T_z": T_z_col,
+            "T_w": T_w_col,
+            "CO2_z": CO2_col,
+            "P_e": P_col,
+            "E_KWh": E_col,
+        },
+        index=df_in.index,
+    )
+    out.index.name = "time"
 
 
     # Can be removed if our use case does not require forecast
@@ -47,11 +87,10 @@ def run_simulation(df_in: pd.DataFrame, p: Params, dt_s: int = 300) -> pd.DataFr
     #    how many rows of data represent a one-hour horizon.
     hor = int(3600 / dt_s)          # e.g. dt_s=300 s  → hor = 12 rows
 
-    # 2. .shift(-hor) moves each series upward by ‘hor’ rows,
-    #    so the value stored at timestamp t now shows the model’s
-    #    state at t + 1 hour.  (The tail rows shift past the index and become NaN.)
-    out["T_z_h1"]  = out["T_z"].shift(-hor)   # 1-hour-ahead zone temperature (°C)
-    out["CO2_h1"]  = out["CO2_z"].shift(-hor) # 1-hour-ahead CO₂ concentration (ppm)
+    # 2. Moving each column upward by ‘hor’ rows means the value stored
+    #    at timestamp t now shows the model’s state at t + 1 hour.
+    #    (The tail rows have no future value and become NaN.)
+    out["T_z_h1"]  = _shift_ahead(T_z_col, hor)   # 1-hour-ahead zone temperature (°C)
+    out["CO2_h1"]  = _shift_ahead(CO2_col, hor)   # 1-hour-ahead CO₂ concentration (ppm)
 
     return out
-
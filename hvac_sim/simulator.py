@@ -1,10 +1,113 @@
+import logging
+import zlib
 import numpy as np
-from .parameters import Params
-from .physics import rhs
+from numba import njit
+from .parameters import Params, ParamsTuple
+from .physics import StepCoeffs, _step_core, read_inputs, step_coeffs
+
+logger = logging.getLogger(__name__)
+
+# Order of the values `HVACSimulator.step_into` writes into its output array
+# (and the keys of the dicts `step` and `step_many` return)
+OUT_FIELDS = ("T_z", "T_w", "CO2_z", "P_e", "E_KWh_cumulative")
+
+# Deliberately not fastmath: that would let LLVM reassociate the
+# compensation terms away, reducing this to a plain sum. Numba reuses the
+# first specialisation it compiles for a signature, and one first compiled
+# while typing a fastmath caller inherits the caller's flags, so the
+# signature is given here to compile it eagerly, with its own flags, before
+# any caller is compiled.
+@njit("UniTuple(float64, 2)(float64, float64, float64)", cache=True)
+def _neumaier_add(e_sum, e_comp, inc):
+    """
+    Adds `inc` to the compensated sum (e_sum, e_comp) (Neumaier's variant
+    of Kahan summation); the total is e_sum + e_comp.
+    """
+    t = e_sum + inc
+    if abs(e_sum) >= abs(inc):
+        e_comp += (e_sum - t) + inc
+    else:
+        e_comp += (inc - t) + e_sum
+    return t, e_comp
+
+@njit(cache=True, fastmath=True)
+def _step_kernel(T_z, T_w, CO2_z, T_out, N_occ, T_set, I_sol, Q_int, dt_s, e_sum, e_comp, p, c):
+    """
+    Compiled body of `HVACSimulator.step`: one exact physics step, with the
+    energy used during it (in kWh) added to the compensated cumulative
+    total (e_sum, e_comp). Returns (T_z, T_w, CO2_z, P_e, e_sum, e_comp).
+    """
+    T_z, T_w, CO2_z, P_e = _step_core(T_z, T_w, CO2_z, T_out, N_occ, T_set, I_sol, Q_int, p, c)
+    e_sum, e_comp = _neumaier_add(e_sum, e_comp, P_e * dt_s / 3600.0)
+    return T_z, T_w, CO2_z, P_e, e_sum, e_comp
+
+@njit(cache=True)
+def _step_no_sol_kernel(T_z, T_w, CO2_z, T_out, N_occ, T_set, Q_int, dt_s, e_sum, e_comp, p, c):
+    """
+    `_step_kernel` for a step without solar gain (I_sol == 0), which is what
+    indoor sensors send. With the zero compiled in as a constant, the solar
+    terms of the (fastmath) step are folded away.
+    """
+    return _step_kernel(T_z, T_w, CO2_z, T_out, N_occ, T_set, 0.0, Q_int, dt_s, e_sum, e_comp, p, c)
+
+@njit(cache=True)
+def _linear_scan_kernel(state, b_z, b_w, b_co2, c, T_z, T_w, CO2_z):
+    """
+    The state-dependent part of `HVACSimulator.step_many`: runs the exact-step
+    recurrence over precomputed input terms (`b_z`, `b_w`, `b_co2`, i.e. the
+    B-matrix and CO₂ gain applied to each step's inputs), writing the new
+    states into `T_z`, `T_w`, `CO2_z` and leaving the final state in `state`.
+    """
+    tz, tw, co2 = state[0], state[1], state[2]
+    for i in range(b_z.shape[0]):
+        tz, tw = (c.Ad_zz * tz + c.Ad_zw * tw + b_z[i],
+                  c.Ad_wz * tz + c.Ad_ww * tw + b_w[i])
+        co2 = c.co2_decay * co2 + b_co2[i]
+        T_z[i] = tz
+        T_w[i] = tw
+        CO2_z[i] = co2
+    state[0] = tz
+    state[1] = tw
+    state[2] = co2
+
+# Fingerprint of the argument layout the step kernels are compiled for (the
+# ParamsTuple and StepCoeffs fields, in order). build_kernel.py bakes it into
+# the ahead-of-time module, whose typed arguments would otherwise silently
+# misread a ParamsTuple or StepCoeffs that has since gained or lost a field.
+_KERNEL_LAYOUT = zlib.crc32(
+    (",".join(ParamsTuple._fields) + ";" + ",".join(StepCoeffs._fields)).encode()
+)
+
+# `step` uses the ahead-of-time compiled copies of the step kernels if they
+# have been built (see build_kernel.py) for the current layout: no JIT
+# compile or cache load at start-up.
+try:
+    from . import hvac_kernel_aot as _aot
+except ImportError:
+    _aot = None
+if _aot is not None and (not hasattr(_aot, "kernel_layout")
+                         or _aot.kernel_layout() != _KERNEL_LAYOUT):
+    logger.warning("hvac_kernel_aot was built for a different Params/StepCoeffs layout, "
+                   "using the JIT kernels instead; rerun build_kernel.py to rebuild it.")
+    _aot = None
+if _aot is not None:
+    _live_step_kernel = _aot.step_kernel
+    _live_step_no_sol_kernel = _aot.step_kernel_no_sol
+else:
+    _live_step_kernel = _step_kernel
+    _live_step_no_sol_kernel = _step_no_sol_kernel
 
 class HVACSimulator:
     """
     Manages the state of the HVAC simulation and updates it step-by-step.
+
+    The state and the batched `step_many` use float32: sensor readings only
+    resolve ~0.1 °C and ~1 ppm, so single precision loses nothing that
+    matters (vs. float64 the error stays below 1e-3 K and 1e-2 ppm) while
+    halving the memory traffic and doubling the SIMD width. The cumulative
+    energy is summed in float64, since a long-running total would drift;
+    for the same reason the step kernels keep it as a compensated
+    (Neumaier) sum, `_E_state = (sum, compensation)`.
     """
     def __init__(self, initial_state: np.ndarray, params: Params, dt_s: int = 300):
         """
@@ -15,11 +118,18 @@ class HVACSimulator:
             params (Params): The model parameters.
             dt_s (int): The simulation time step in seconds.
         """
-        self.state = np.array(initial_state, dtype=float)
+        self.state = np.array(initial_state, dtype=np.float32)
         self.params = params
+        self._ptup = params.as_tuple()  # flat copy for the compiled physics kernel
         self.dt_s = dt_s
-        self.cumulative_energy_kwh = 0.0
-        print(f"Simulator initialized with state: {self.state}")
+        self._dt_f = float(dt_s)  # the kernel is compiled for a float time step
+        self._coeffs = step_coeffs(params, dt_s)  # exact-step matrices for this dt
+        # Single-precision copies for step_many
+        self._ptup32 = ParamsTuple(*np.asarray(self._ptup, dtype=np.float32))
+        self._coeffs32 = StepCoeffs(*np.asarray(self._coeffs, dtype=np.float32))
+        self._E_state = (0.0, 0.0)  # cumulative energy in kWh, as (sum, compensation)
+        self._out_buf = np.empty(len(OUT_FIELDS))  # reused by step/step_into
+        logger.info("Simulator initialized with state: %s", self.state)
 
     def step(self, inputs: dict) -> dict:
         """
@@ -32,22 +142,160 @@ class HVACSimulator:
         Returns:
             dict: A dictionary containing the updated state and power usage.
         """
-        # 1. Calculate the rates of change using the physics model
-        deriv = rhs(self.state, inputs, self.params)
+        out = self._advance(*read_inputs(inputs), self._out_buf)
+        return dict(zip(OUT_FIELDS, out.tolist()))
 
-        # 2. Update the state variables (T_z, T_w, CO2) using Euler's method
-        self.state += deriv[:3] * self.dt_s
+    def step_into(self, T_out, N_occ, T_set, I_sol=0.0, out=None) -> np.ndarray:
+        """
+        Same as `step`, but with the sensor readings passed positionally and
+        the results written into a preallocated array instead of a new dict,
+        so nothing is allocated per message. Internal gains are 100 W per
+        person, as in `read_inputs`.
 
-        # 3. Get the electric power for this step and update cumulative energy
-        power_kw = deriv[3]
-        self.cumulative_energy_kwh += power_kw * self.dt_s / 3600.0
+        Args:
+            T_out, N_occ, T_set, I_sol (float): The sensor readings.
+            out (np.ndarray, optional): 5-element float array to write the
+                results into, in `OUT_FIELDS` order. Defaults to a buffer
+                owned by the simulator, which the next step overwrites.
 
-        # 4. Return the results for this step
-        results = {
-            "T_z": self.state[0],
-            "T_w": self.state[1],
-            "CO2_z": self.state[2],
-            "P_e": power_kw,
-            "E_KWh_cumulative": self.cumulative_energy_kwh,
+        Returns:
+            np.ndarray: `out`, holding [T_z, T_w, CO2_z, P_e, E_KWh_cumulative].
+        """
+        if out is None:
+            out = self._out_buf
+        # The kernel is compiled for floats only. Decoded messages mostly
+        # carry floats already, so only convert what isn't one (skips a call
+        # per field); N_occ usually arrives as an int.
+        if T_out.__class__ is not float:
+            T_out = float(T_out)
+        if N_occ.__class__ is not float:
+            N_occ = float(N_occ)
+        if T_set.__class__ is not float:
+            T_set = float(T_set)
+        if I_sol.__class__ is not float:
+            I_sol = float(I_sol)
+        return self._advance(T_out, N_occ, T_set, I_sol, 100.0 * N_occ, out)
+
+    def _advance(self, T_out, N_occ, T_set, I_sol, Q_int, out):
+        """Runs one step on already unpacked float inputs, writing the results into `out`."""
+        state = self.state
+
+        # 1. Advance the state variables (T_z, T_w, CO2) by one exact step
+        #    of the (linear) physics model, getting power and energy used too
+        #    (and adding this step's energy to the cumulative total)
+        if I_sol == 0.0:
+            T_z, T_w, CO2_z, power_kw, e_sum, e_comp = _live_step_no_sol_kernel(
+                state[0], state[1], state[2], T_out, N_occ, T_set, Q_int,
+                self._dt_f, *self._E_state, self._ptup, self._coeffs
+            )
+        else:
+            T_z, T_w, CO2_z, power_kw, e_sum, e_comp = _live_step_kernel(
+                state[0], state[1], state[2], T_out, N_occ, T_set, I_sol, Q_int,
+                self._dt_f, *self._E_state, self._ptup, self._coeffs
+            )
+        state[0] = T_z
+        state[1] = T_w
+        state[2] = CO2_z
+        self._E_state = (e_sum, e_comp)
+
+        # 2. Store the results for this step (the state as kept, i.e. in float32)
+        out[0] = state[0]
+        out[1] = state[1]
+        out[2] = state[2]
+        out[3] = power_kw
+        out[4] = e_sum + e_comp
+        return out
+
+    @property
+    def cumulative_energy_kwh(self) -> float:
+        """Total electric energy used since the simulator was created, in kWh."""
+        e_sum, e_comp = self._E_state
+        return e_sum + e_comp
+
+    def step_many(self, T_out, N_occ, T_set, I_sol) -> dict:
+        """
+        Performs one simulation step per element of the input columns, with
+        the inputs passed as separate arrays (one per signal) rather than rows.
+
+        Everything that does not depend on the evolving state (forcing terms,
+        power, energy) is computed with whole-array NumPy operations; only the
+        three-variable recurrence itself runs in a compiled loop.
+
+        Args:
+            T_out, N_occ, T_set, I_sol (array-like): Length N columns of sensor
+                                                     readings, one per step.
+
+        Returns:
+            dict: Arrays of length N with the same keys as `step` returns.
+        """
+        p = self._ptup32
+        T_out = np.asarray(T_out, dtype=np.float32)
+        N_occ = np.asarray(N_occ, dtype=np.float32)
+        T_set = np.asarray(T_set, dtype=np.float32)
+        I_sol = np.asarray(I_sol, dtype=np.float32)
+
+        # Input terms of each step (see physics._step_core), with internal
+        # gains of 100 W per person as in read_inputs
+        c = self._coeffs32
+        Q_int = N_occ * 100.0
+        b_z = np.multiply(T_out, c.B_z_out)
+        b_z += Q_int * c.B_z_int
+        b_z += T_set * c.B_z_set
+        b_w = np.multiply(T_out, c.B_w_out)
+        b_w += Q_int * c.B_w_int
+        b_w += T_set * c.B_w_set
+        if I_sol.any():  # usually all zero (indoor sensors): skip two array passes
+            b_z += I_sol * c.B_z_sol
+            b_w += I_sol * c.B_w_sol
+        b_co2 = np.multiply(N_occ, c.co2_occ)
+        b_co2 += c.co2_const
+
+        # Zone temperature at the start of each step, for the HVAC power
+        T_start = np.empty_like(T_out)
+        T_start[:1] = self.state[0]
+
+        T_z = np.empty_like(T_out)
+        T_w = np.empty_like(T_out)
+        CO2_z = np.empty_like(T_out)
+        _linear_scan_kernel(self.state, b_z, b_w, b_co2, c, T_z, T_w, CO2_z)
+        T_start[1:] = T_z[:-1]
+
+        # Power drawn at the start of each step (see physics._hvac_power_core)
+        abs_Q = np.subtract(T_start, T_set, out=T_start)
+        np.abs(abs_Q, out=abs_Q)
+        abs_Q *= p.k_hvac
+        P_e = abs_Q * p.inv_COP
+        P_e += p.P_fan_des
+        P_e *= abs_Q > 0.0
+
+        energy = np.cumsum(P_e, dtype=np.float64)
+        energy *= self._dt_f / 3600.0
+        energy += self.cumulative_energy_kwh
+        if energy.shape[0]:
+            # One rounding per batch rather than per step: no compensation needed
+            self._E_state = (float(energy[-1]), 0.0)
+
+        return {
+            "T_z": T_z,
+            "T_w": T_w,
+            "CO2_z": CO2_z,
+            "P_e": P_e,
+            "E_KWh_cumulative": energy,
         }
-        return results
\ No newline at end of file
+
+
+# Compile (or load from the on-disk cache) at import, i.e. before any MQTT
+# subscription is made, so the first real message doesn't pay for it.
+# `step` passes the float32 state with float64 inputs and coefficients; the
+# scan behind `step_many` runs entirely in float32.
+_c32 = StepCoeffs(*np.asarray(step_coeffs(Params(), 300.0), dtype=np.float32))
+_s32 = np.array([24.0, 24.0, 600.0], dtype=np.float32)
+if _live_step_kernel is _step_kernel:
+    _step_kernel(_s32[0], _s32[1], _s32[2], 25.0, 0.0, 24.0, 0.0, 0.0, 300.0, 0.0, 0.0,
+                 Params().as_tuple(), step_coeffs(Params(), 300.0))
+    _step_no_sol_kernel(_s32[0], _s32[1], _s32[2], 25.0, 0.0, 24.0, 0.0, 300.0, 0.0, 0.0,
+                        Params().as_tuple(), step_coeffs(Params(), 300.0))
+_linear_scan_kernel(_s32, np.zeros(1, dtype=np.float32), np.zeros(1, dtype=np.float32),
+                    np.zeros(1, dtype=np.float32), _c32, np.empty(1, dtype=np.float32),
+                    np.empty(1, dtype=np.float32), np.empty(1, dtype=np.float32))
+del _c32, _s32
@@ -8,12 +8,25 @@
 #   uses paho-MQTT to publish data and also subscribe to data to and from a specific topic respectively.
 # -----------------------------------------------------------------------------
 
+import functools
 import logging
-import json
+import selectors
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field, replace
+from typing import Optional
 from paho.mqtt import client as paho_mqtt_client
 from dotenv import load_dotenv
 import os
 
+# orjson parses the raw payload bytes much faster than the standard library;
+# fall back to json (same loads/dumps names) if it isn't installed.
+try:
+    import orjson as json
+except ImportError:
+    import json
+
 # Configure logging for MQTT Broker interactions
 logging.basicConfig(
     level=logging.INFO,  # Minimum logging level
@@ -21,38 +34,40 @@ logging.basicConfig(
     handlers=[logging.StreamHandler()]  # Output logs to terminal
 )
 
+@dataclass(frozen=True, slots=True)
 class MQTTClientConfig:
     """
     Configuration class to handle MQTT client setup, including credentials.
-    """
-
-    def __init__(self, client_id, broker_address, port) -> None:
-        """
-        Initialize the MQTT client configuration.
+    Immutable, so one loaded config can be shared and reused safely
+    (e.g. across reconnects); use dataclasses.replace() to derive a modified copy.
 
-        Args:
-            client_id (str): Unique identifier for the MQTT client.
-            broker_address (str): Address of the MQTT broker.
-            port (int): Port to connect to the MQTT broker.
-        """
-        self.has_credentials = False
-        self.client_id = client_id
-        self.broker_address = broker_address
-        self.port = port
-        self.username = None
-        self.password = None
-
-    def set_credentials(self, username, password):
+    Args:
+        client_id (str): Unique identifier for the MQTT client.
+        broker_address (str): Address of the MQTT broker.
+        port (int): Port to connect to the MQTT broker.
+        username (str, optional): The MQTT client's username.
+        password (str, optional): The MQTT client's password.
+    """
+    client_id: str
+    broker_address: str
+    port: int
+    username: Optional[str] = None
+    password: Optional[str] = field(default=None, repr=False)
+
+    @property
+    def has_credentials(self):
+        """Whether both a username and a password are set."""
+        return self.username is not None and self.password is not None
+
+    def with_credentials(self, username, password):
         """
-        Set the username and password for the MQTT client.
+        Return a copy of this configuration with the given username and password.
 
         Args:
             username (str): The MQTT client's username.
             password (str): The MQTT client's password.
         """
-        self.has_credentials = True
-        self.username = username
-        self.password = password
+        return replace(self, username=username, password=password)
 
 
 class MQTTClient:
@@ -71,15 +86,34 @@ class MQTTClient:
         self.logger = logging.getLogger("mqtt")
         self.mqtt_config = config
         self.topic = topic
-        self.mqtt_client = paho_mqtt_client.Client(self.mqtt_config.client_id)
+        self.mqtt_client = paho_mqtt_client.Client(self.mqtt_config.client_id, clean_session=True)
+
+        # Set by disconnect_mqtt() to stop the flusher thread of subscribe_batched()
+        self._flush_stop = threading.Event()
+
+        # Whether subscribe()/subscribe_batched() was called: the broker forgets
+        # the subscription with the (clean) session, so on_connect renews it
+        self._subscribed = False
+
+        # run_selector()'s wait before its next reconnect attempt, in seconds;
+        # 0 right after a connection the broker accepted
+        self._reconnect_delay = 0
+
+        # Back off between 1 s and 30 s when reconnecting after a dropped
+        # connection, instead of stalling the caller
+        self.mqtt_client.reconnect_delay_set(min_delay=1, max_delay=30)
 
         # Set logging level to INFO and log client creation
         self.logger.setLevel(logging.INFO)
         self.logger.info("MQTT Client %s created", self.mqtt_config.client_id)
 
-    def connect_mqtt(self):
+    def connect_mqtt(self, background=True):
         """
         Connect the MQTT client to the broker and start the MQTT loop.
+
+        Args:
+            background (bool, optional): Run paho's network loop in its own thread.
+                If False, the caller drives it with run_forever() instead. Defaults to True.
         """
 
         def on_connect(client, userdata, flags, rc):
@@ -94,6 +128,9 @@ class MQTTClient:
             """
             if rc == 0:
                 self.logger.info("Connected to MQTT Broker on topic %s successfully", self.topic)
+                self._reconnect_delay = 0
+                if self._subscribed:
+                    client.subscribe(self.topic)
             else:
                 self.logger.info("Failed to connect to MQTT Broker on topic %s, return code %d", self.topic, rc)
 
@@ -121,39 +158,124 @@ class MQTTClient:
 
         # Connect to the MQTT broker and start the MQTT loop in the background
         self.mqtt_client.connect(self.mqtt_config.broker_address, self.mqtt_config.port)
-        self.mqtt_client.loop_start()
+        if background:
+            self.mqtt_client.loop_start()
+
+    def run_forever(self):
+        """
+        Run paho's network loop in the calling thread until disconnect_mqtt()
+        is called, reconnecting after dropped connections. Use together with
+        connect_mqtt(background=False), so no extra loop thread is started.
+        """
+        self.mqtt_client.loop_forever(retry_first_connection=False)
+
+    def run_selector(self, stop, timeout=1.0):
+        """
+        Drive paho's network I/O from the calling thread until the `stop`
+        event is set: the client socket is watched with the platform's best
+        selector (epoll on Linux), and loop_read()/loop_write() run only when it is
+        ready. No paho loop thread is needed, so message callbacks run right
+        here. Use together with connect_mqtt(background=False).
+
+        Dropped connections are re-established, backing off between 1 s and
+        30 s like reconnect_delay_set() in __init__. The backoff only starts
+        over once the broker has accepted a connection (CONNACK), not when
+        just the TCP connect succeeds.
+
+        Args:
+            stop (threading.Event): Set (e.g. from a signal handler) to return.
+            timeout (float, optional): Longest wait on the socket, which is also
+                how quickly `stop` is noticed. Defaults to 1.0.
+        """
+        client = self.mqtt_client
+        selector = selectors.DefaultSelector()
+        sock, events = None, 0
+
+        try:
+            while not stop.is_set():
+                if client.socket() is not sock:
+                    # Connected, reconnected or dropped: follow the new socket
+                    if sock is not None:
+                        selector.unregister(sock)
+                    sock, events = client.socket(), 0
+
+                if sock is None:
+                    # First attempt right away, then wait 1, 2, 4, ... 30 s
+                    # between attempts until on_connect reports success
+                    delay = self._reconnect_delay
+                    if delay:
+                        self.logger.info("Not connected, retrying in %d s", delay)
+                        if stop.wait(delay):
+                            break
+                    self._reconnect_delay = min(max(delay * 2, 1), 30)
+                    try:
+                        client.reconnect()
+                    except OSError as e:
+                        self.logger.info("Reconnect failed (%s)", e)
+                    continue
+
+                # Only ask for writability while paho has something to send
+                wanted = selectors.EVENT_READ | (selectors.EVENT_WRITE if client.want_write() else 0)
+                if wanted != events:
+                    if events:
+                        selector.modify(sock, wanted)
+                    else:
+                        selector.register(sock, wanted)
+                    events = wanted
+
+                for _, mask in selector.select(timeout):
+                    if mask & selectors.EVENT_READ:
+                        client.loop_read()
+                    if mask & selectors.EVENT_WRITE and client.socket() is not None:
+                        client.loop_write()
+
+                # Keepalive pings and timeouts
+                client.loop_misc()
+        finally:
+            selector.close()
 
     def disconnect_mqtt(self):
         """
         Disconnect the MQTT client from the broker and stop the loop.
         """
         self.logger.info("MQTT Broker Client disconnected successfully")
+        self._flush_stop.set()
         self.mqtt_client.disconnect()
         self.mqtt_client.loop_stop()
 
-    def publish(self, msg, callback):
+    def publish(self, msg):
         """
         Publish a message to the MQTT topic.
 
         Args:
-            msg (str): The message to be published.
-            callback (function): A callback function to modify or prepare the message.
+            msg (bytes | str): The already serialized message to be published.
         """
-        self.logger.info("Published to topic %s", self.topic)
+        # Per-message logging is only formatted when debug output is on
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug("Published to topic %s", self.topic)
 
-        # Process the message using the callback
-        msg = callback(msg)
-        
         # Publish the message to the specified topic
-        self.mqtt_client.publish(self.topic, msg)
+        self.mqtt_client.publish(self.topic, msg, qos=0)
+
+    def _subscribe_topic(self):
+        """
+        Subscribe to the topic now if connected; either way on_connect
+        (re)subscribes after every accepted (re)connection from here on.
+        """
+        self._subscribed = True
+        if self.mqtt_client.is_connected():
+            self.mqtt_client.subscribe(self.topic)
 
-    def subscribe(self, callback=None):
+    def subscribe(self, callback=None, decoder=None):
         """
         Subscribe to the MQTT topic and handle incoming messages.
 
         Args:
             callback (function, optional): The callback function to handle incoming messages. Defaults to None.
+            decoder (function, optional): Turns the raw payload bytes into what `callback` receives;
+                                          it should raise ValueError for payloads it rejects. Defaults to JSON decoding.
         """
+        decode = json.loads if decoder is None else decoder
         self.logger.info("Subscribed to MQTT Broker topic %s", self.topic)
 
         def on_message(client, userdata, msg):
@@ -165,14 +287,87 @@ class MQTTClient:
                 userdata: User-defined data passed to the callback.
                 msg: The message received from the broker.
             """
-            msg_dict = json.loads(msg.payload)
+            try:
+                msg_dict = decode(msg.payload)
+            except ValueError as e:
+                self.logger.warning("Dropped undecodable message on topic %s: %s", self.topic, e)
+                return
 
             if callback is not None:
                 callback(msg_dict)
         
         # Assign the callback function for message handling and subscribe to the topic
         self.mqtt_client.on_message = on_message
-        self.mqtt_client.subscribe(self.topic)
+        self._subscribe_topic()
+
+    def subscribe_batched(self, batch_callback, batch_size=64, flush_interval_s=0.05):
+        """
+        Subscribe to the MQTT topic and hand incoming messages over in batches.
+
+        The paho network thread only queues the raw payloads, with their
+        arrival time. A separate flusher thread decodes whatever has queued up and calls
+        `batch_callback` once per batch: as soon as `batch_size` messages are
+        waiting, or every `flush_interval_s` seconds otherwise. The callback
+        is always called from that one thread, so it never runs concurrently
+        with itself.
+
+        Args:
+            batch_callback (function): Called with a list of (arrival_ns, message) pairs:
+                                       when the message arrived, in ns since the epoch
+                                       (time.time_ns()), and the decoded message (a dict).
+                                       Payloads that aren't JSON objects are dropped.
+            batch_size (int, optional): Queue length that triggers an immediate flush. Defaults to 64.
+            flush_interval_s (float, optional): Longest time a message waits in the queue. Defaults to 0.05.
+        """
+        self.logger.info("Subscribed to MQTT Broker topic %s (batched)", self.topic)
+
+        pending = deque()
+        batch_ready = threading.Event()
+
+        def on_message(client, userdata, msg):
+            """
+            Callback function triggered when a message is received on the subscribed topic.
+            Only queues the payload and its arrival time; decoding happens in
+            the flusher thread, possibly much later.
+            """
+            pending.append((time.time_ns(), msg.payload))
+            if len(pending) >= batch_size:
+                batch_ready.set()
+
+        def flush_loop():
+            """Drain the queue into `batch_callback` until the client disconnects."""
+            while not self._flush_stop.is_set():
+                batch_ready.wait(flush_interval_s)
+                batch_ready.clear()
+
+                batch = []
+                while pending:
+                    arrival_ns, payload = pending.popleft()
+                    try:
+                        msg_dict = json.loads(payload)
+                    except ValueError:
+                        self.logger.warning("Dropped undecodable message on topic %s", self.topic)
+                        continue
+                    # Valid JSON, but not an object (e.g. a bare number)
+                    if not isinstance(msg_dict, dict):
+                        self.logger.warning("Dropped non-object message on topic %s", self.topic)
+                        continue
+                    batch.append((arrival_ns, msg_dict))
+
+                if batch:
+                    # An error in the callback must not end this thread:
+                    # paho would keep queueing messages nobody processes
+                    try:
+                        batch_callback(batch)
+                    except Exception:
+                        self.logger.exception("Error handling a batch of %d messages on topic %s", len(batch), self.topic)
+
+        self._flush_stop.clear()
+        threading.Thread(target=flush_loop, name="mqtt-batch-flusher", daemon=True).start()
+
+        # Assign the callback function for message handling and subscribe to the topic
+        self.mqtt_client.on_message = on_message
+        self._subscribe_topic()
 
 
 def load_mqtt_config() -> MQTTClientConfig:
@@ -200,11 +395,26 @@ def load_mqtt_config() -> MQTTClientConfig:
 
     # Set credentials if provided
     if username is not None and password is not None:
-        mqtt_client_config.set_credentials(username=username, password=password)
+        mqtt_client_config = mqtt_client_config.with_credentials(username=username, password=password)
 
     return mqtt_client_config
 
 
+@functools.lru_cache(maxsize=1)
+def get_mqtt_config() -> MQTTClientConfig:
+    """
+    Load the MQTT client configuration once per process.
+
+    Same as load_mqtt_config(), but later calls (e.g. when reconnecting)
+    return the already loaded, immutable config instead of re-reading the
+    environment and dotenv files.
+
+    Returns:
+        MQTTClientConfig: The loaded MQTT client configuration object.
+    """
+    return load_mqtt_config()
+
+
 def load_mqtt_client(config: MQTTClientConfig) -> MQTTClient:
     """
     Initialize the MQTT client with the provided configuration.
@@ -237,12 +447,9 @@ def load_mqtt_config_with_parameters(broker_address=str, broker_port=int, client
     Returns:
         MQTTClientConfig: The configured MQTTClientConfig object.
     """
-    # Initialize configuration with provided parameters
-    mqtt_client_config = MQTTClientConfig(broker_address=broker_address, broker_port=broker_port, client_id=client_id, username=username, password=password)
-
-    # Set credentials if provided
-    if username is not None and password is not None:
-        mqtt_client_config.set_credentials(username=username, password=password)
+    # Initialize configuration with provided parameters; credentials only
+    # count when both are provided (see MQTTClientConfig.has_credentials)
+    mqtt_client_config = MQTTClientConfig(client_id=client_id, broker_address=broker_address, port=broker_port, username=username, password=password)
 
     return mqtt_client_config
 
@@ -1,10 +1,16 @@
 import paho.mqtt.client as mqtt
 import time
-import json
 import random
 import os
 from dotenv import load_dotenv
 
+# orjson serialises straight to bytes, which paho publishes as-is;
+# fall back to json if it isn't installed.
+try:
+    import orjson as json
+except ImportError:
+    import json
+
 # --- Configuration ---
 load_dotenv("local.env")
 BROKER_ADDRESS = os.getenv("BROKER_ADDRESS")
@@ -12,6 +18,8 @@ PORT = int(os.getenv("BROKER_PORT"))
 SENSOR_TOPIC = os.getenv("BROKER_TOPIC")
 CONTROL_TOPIC = os.getenv("CONTROL_TOPIC")
 CLIENT_ID = "interactive_sensor_publisher"
+BATCH_SIZE = 10          # Samples sent together in one MQTT message
+SAMPLE_INTERVAL_S = 1.0  # Seconds between simulated sensor readings
 
 # Global variable to hold the current setpoint, with a default
 current_setpoint = 24.0
@@ -29,10 +37,12 @@ def on_message(client, userdata, msg):
     """Callback for when a message is received on the control topic."""
     global current_setpoint
     try:
-        new_setpoint = float(msg.payload.decode())
+        # The payload is a bare JSON number (e.g. b"24.5"); orjson parses the
+        # bytes directly, without decoding them to a str first
+        new_setpoint = float(json.loads(msg.payload))
         current_setpoint = new_setpoint
         print(f"\nReceived new setpoint from GUI: {current_setpoint}°C\n")
-    except ValueError:
+    except (ValueError, TypeError):
         print(f"Could not parse setpoint from payload: {msg.payload}")
 
 def run():
@@ -42,6 +52,7 @@ def run():
     client.connect(BROKER_ADDRESS, PORT)
     client.loop_start() # Handles reconnects and processes messages automatically
 
+    batch = []
     while True:
         # Simulate changing sensor data
         temp_outside = round(25 + random.uniform(-2, 2), 2)
@@ -49,22 +60,27 @@ def run():
         
         # This data structure must match what the subscriber expects
         # CRUCIALLY, it now uses the 'current_setpoint' updated by the GUI
-        data = {
+        batch.append({
             "T_out": temp_outside,
             "N_occ": occupants,
             "T_set": current_setpoint 
-        }
-        
-        msg = json.dumps(data)
-        result = client.publish(SENSOR_TOPIC, msg)
-        status = result[0]
+        })
         
-        if status == 0:
-            print(f"Sent `{msg}` to topic `{SENSOR_TOPIC}`")
-        else:
-            print(f"Failed to send message to topic {SENSOR_TOPIC}")
+        # Send the readings together as {"batch": [...]} once enough have
+        # piled up: one publish (and one broker round trip) per batch
+        # instead of per reading.
+        if len(batch) >= BATCH_SIZE:
+            msg = json.dumps({"batch": batch})
+            result = client.publish(SENSOR_TOPIC, msg)
+            status = result[0]
+            
+            if status == 0:
+                print(f"Sent batch of {len(batch)} samples to topic `{SENSOR_TOPIC}`")
+            else:
+                print(f"Failed to send message to topic {SENSOR_TOPIC}")
+            batch = []
         
-        time.sleep(10) # Publish new data every 10 seconds
+        time.sleep(SAMPLE_INTERVAL_S) # New sensor reading every second
 
 if __name__ == '__main__':
     run()
\ No newline at end of file
@@ -19,14 +19,20 @@ def main():
 
     print("Running simulation...")
     # Run the simulation with the synthetic data and default parameters.
-    results = run_simulation(df, params)
+    dt_s = 300
+    results = run_simulation(df, params, dt_s)
 
     # --- Print Results ---
     print("--- Simulation Results (First 5 Steps) ---")
     print(results.head())
 
     print("\n--- Hourly Energy Consumption (kWh) ---")
-    print(results["E_KWh"].resample("1H").last().diff().dropna())
+    # With a fixed time step every hour is exactly `hor` rows, so the energy
+    # at the end of each hour is a strided slice of the cumulative column.
+    hor = 3600 // dt_s
+    hourly_end = results["E_KWh"].to_numpy()[hor - 1::hor]
+    hourly_kwh = np.diff(hourly_end, prepend=0.0)
+    print(pd.Series(hourly_kwh, index=results.index[::hor][:len(hourly_kwh)], name="E_KWh"))
 
 if __name__ == "__main__":
     main()
@@ -1,12 +1,16 @@
-import time
-import json
+import functools
 import os
+import queue
+import signal
+import sys
+import threading
+import msgspec
 from dotenv import load_dotenv
 
 # Import our custom modules
 from hvac_sim.parameters import Params
 from hvac_sim.simulator import HVACSimulator
-from mqtt_integration.client import MQTTClient, load_mqtt_config
+from mqtt_integration.client import MQTTClient, get_mqtt_config
 
 # --- Global Simulator Instance ---
 # Initialize model parameters with defaults
@@ -20,70 +24,166 @@ initial_hvac_state = [24.0, 24.0, 600.0]
 # The time step (dt_s) should match how often you expect new sensor data
 hvac_sim = HVACSimulator(initial_state=initial_hvac_state, params=hvac_params, dt_s=300) # 300s = 5 mins
 
-def on_sensor_data_received(msg_dict):
+# --- Console Output ---
+# Messages are formatted on the MQTT thread but written to stdout by a
+# separate daemon thread, which joins whatever has queued up (up to 64
+# messages) into a single write. The MQTT thread never blocks on stdout.
+_out_queue = queue.SimpleQueue()
+_DRAIN_BATCH = 64
+
+def _drain(q):
+    """Writes queued output strings until it receives None."""
+    write, flush = sys.stdout.write, sys.stdout.flush
+    while True:
+        text = q.get()
+        if text is None:
+            return
+        batch = [text]
+        while len(batch) < _DRAIN_BATCH:
+            try:
+                text = q.get_nowait()
+            except queue.Empty:
+                break
+            if text is None:
+                write("".join(batch))
+                flush()
+                return
+            batch.append(text)
+        write("".join(batch))
+        flush()
+
+_printer = threading.Thread(target=_drain, args=(_out_queue,), name="stdout-writer", daemon=True)
+_printer.start()
+
+# Looked up once here rather than on every message
+_step_into = hvac_sim.step_into
+_OUT = _out_queue.put_nowait
+# Fields by position in the step_into output (see hvac_sim.simulator.OUT_FIELDS)
+_TEMPLATE = (
+    "--- HVAC Model Updated ---\n"
+    "  Zone Temperature: {0:.2f} °C\n"
+    "  CO2 Level: {2:.0f} ppm\n"
+    "  Current Power Draw: {3:.3f} kW\n"
+    "  Cumulative Energy: {4:.3f} kWh\n"
+    "--------------------------\n"
+)
+
+# --- Message Schema ---
+class SensorMsg(msgspec.Struct):
+    """One sensor sample, as published on the sensor topic."""
+    T_out: float
+    N_occ: float  # any number is accepted, truncated to a whole count as int() did
+    T_set: float
+    I_sol: float = 0.0  # Optional solar gain
+
+    def __post_init__(self):
+        self.N_occ = int(self.N_occ)
+
+class SensorPayload(msgspec.Struct):
+    """
+    A message on the sensor topic: either a single sample (the SensorMsg
+    fields at the top level) or several as {"batch": [sample, ...]}.
+    """
+    T_out: float | None = None
+    N_occ: float | None = None
+    T_set: float | None = None
+    I_sol: float = 0.0
+    batch: list[SensorMsg] | None = None
+
+# Parse, validate and convert the payload in one pass. Lax mode still
+# accepts numbers sent as strings, as the old float()/int() calls did.
+_DEC = msgspec.json.Decoder(SensorPayload, strict=False)
+
+def decode_sensor_payload(payload):
+    """
+    Decodes a raw MQTT payload into a list of SensorMsg. Raises
+    msgspec.ValidationError (a ValueError) if a sample lacks a required key
+    or has a value of the wrong type.
+    """
+    msg = _DEC.decode(payload)
+    if msg.batch is not None:
+        return msg.batch
+    for name in ("T_out", "N_occ", "T_set"):
+        if getattr(msg, name) is None:
+            raise msgspec.ValidationError(f"Object missing required field `{name}`")
+    return [SensorMsg(msg.T_out, msg.N_occ, msg.T_set, msg.I_sol)]
+
+def on_sensor_data_received(samples):
     """
     This is the core callback function. It gets triggered by the MQTT client
-    whenever a new message arrives on the subscribed topic.
+    whenever a new message arrives on the subscribed topic, with the samples
+    it carried (one, or several for a {"batch": [...]} message).
     """
-    print(f"\nReceived sensor data: {msg_dict}")
-
-    try:
-        # We expect the message payload to be a JSON string with these keys
-        inputs = {
-            "T_out": float(msg_dict["T_out"]),
-            "N_occ": int(msg_dict["N_occ"]),
-            "T_set": float(msg_dict["T_set"]),
-            "I_sol": float(msg_dict.get("I_sol", 0.0)) # Optional solar gain
-        }
-
-        # Run one step of the simulation with the new inputs
-        results = hvac_sim.step(inputs)
-
-        # Print the results
-        print("--- HVAC Model Updated ---")
-        print(f"  Zone Temperature: {results['T_z']:.2f} °C")
-        print(f"  CO2 Level: {results['CO2_z']:.0f} ppm")
-        print(f"  Current Power Draw: {results['P_e']:.3f} kW")
-        print(f"  Cumulative Energy: {results['E_KWh_cumulative']:.3f} kWh")
-        print("--------------------------")
-
-    except (KeyError, ValueError) as e:
-        print(f"Error processing message: {e}. Ensure payload is valid JSON with required keys.")
+    for sample in samples:
+        process_sample(sample)
+
+def process_sample(m):
+    """Runs one simulation step for a single SensorMsg and prints the results."""
+    # Run one step of the simulation with the new inputs
+    # (into the simulator's own output buffer, reused for every message)
+    results = _step_into(m.T_out, m.N_occ, m.T_set, m.I_sol)
+
+    # Print the sample and its results, as one queued string
+    _OUT(f"\nReceived sensor data: {m}\n" + _TEMPLATE.format(*results.tolist()))
+
+# --- Configuration ---
+_CONFIG_LOADED = False
+
+def _ensure_config():
+    """Loads local.env into the environment, only the first time it is called."""
+    global _CONFIG_LOADED
+    if _CONFIG_LOADED:
+        return
+    load_dotenv("local.env")
+    _CONFIG_LOADED = True
+
+@functools.lru_cache(maxsize=1)
+def get_topic():
+    """
+    Returns the sensor topic, read from the environment once; later calls
+    (e.g. on reconnect) reuse it. The MQTT settings are cached by
+    get_mqtt_config itself. Expects _ensure_config() to have run.
+    """
+    return os.getenv("BROKER_TOPIC")
 
 def main():
     """Main function to set up MQTT client and run the application."""
+    _ensure_config()
     print("--- Starting Live HVAC Simulation ---")
 
-    # Load MQTT configuration from the .env file
-    load_dotenv("local.env")
-    mqtt_config = load_mqtt_config()
+    # Set by Ctrl+C; stops the network loop below
+    stop = threading.Event()
+    signal.signal(signal.SIGINT, lambda *_: stop.set())
 
-    # Get the topic from environment variables
-    topic = os.getenv("BROKER_TOPIC")
+    # Load MQTT configuration and the topic from the environment
+    mqtt_config = get_mqtt_config()
+    topic = get_topic()
     if not topic:
         raise ValueError("BROKER_TOPIC not set in environment file!")
 
     # Initialize the MQTT Client
     mqtt_client = MQTTClient(config=mqtt_config, topic=topic)
 
-    # Connect to the MQTT broker
-    mqtt_client.connect_mqtt()
+    # Connect to the MQTT broker; the network loop runs in this thread (below)
+    mqtt_client.connect_mqtt(background=False)
 
     # Subscribe to the topic and link our callback function
     # This tells the client: "When a message comes in, run on_sensor_data_received"
-    mqtt_client.subscribe(callback=on_sensor_data_received)
+    mqtt_client.subscribe(callback=on_sensor_data_received, decoder=decode_sensor_payload)
 
     print(f"MQTT client connected. Subscribed to topic '{topic}'. Waiting for sensor data...")
     print("Press Ctrl+C to exit.")
 
-    # Keep the script running indefinitely to listen for messages
-    try:
-        while True:
-            time.sleep(1)
-    except KeyboardInterrupt:
-        print("\nShutting down...")
-        mqtt_client.disconnect_mqtt()
-        print("Application stopped.")
+    # Handle the MQTT traffic (and so our callback) right here, waking up
+    # only when the socket is ready, until Ctrl+C is pressed
+    mqtt_client.run_selector(stop)
+    _OUT("\nShutting down...\n")
+    mqtt_client.disconnect_mqtt()
+
+    # Let the writer thread print everything still queued before exiting
+    _OUT(None)
+    _printer.join()
+    print("Application stopped.")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file